@@ -1,22 +1,45 @@
 import sys
 import os
 import threading
+from functools import partial
+import multiprocessing
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLineEdit, QLabel, QSlider, QGroupBox, QFileDialog,
     QMessageBox, QStatusBar, QRadioButton, QStackedWidget, QColorDialog, QFontDialog,
-    QCheckBox 
+    QCheckBox, QProgressBar, QSpinBox 
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QObject 
+from PyQt5.QtCore import Qt, QTimer, QThread, QSettings 
 from PyQt5.QtGui import QIcon, QColor, QFont
 
-from logic import ImageWatermarker
+from logic import ImageWatermarker, PILLOW_SIMD
 from logic import WatermarkWorker
 
 class WatermarkApp(QMainWindow):
     """
     The main GUI application for image watermarking using PyQt5.
     """
+    _COLOR_CSS = "background-color: %s; border: 1px solid black;" # Style of the text colour preview swatch
+
+    # Type of every stored setting; INI files keep plain text, so QSettings needs it to give the value back.
+    _SETTINGS_TYPES = {
+        "input_folder": str,
+        "output_folder": str,
+        "selected_watermark_type": str,
+        "watermark_image": str,
+        "sender_text": str,
+        "receiver_text": str,
+        "text_font_family": str,
+        "text_font_size": int,
+        "text_color": str,
+        "text_outline_enabled": bool,
+        "text_repetition_enabled": bool,
+        "watermark_size": float,
+        "watermark_opacity": float,
+        "high_quality_encode": bool,
+        "max_input_dim": int,
+    }
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Image Watermarker")
@@ -32,40 +55,56 @@ class WatermarkApp(QMainWindow):
         self.input_folder_path = ""
         self.output_folder_path = ""
         self.watermark_image_path = ""
+        self._watermark_image_loaded = False # The watermark image is decoded on first use, not at startup
 
         self.sender_text = ""
         self.receiver_text = ""
         self.text_font = QFont("Arial", 24) 
         self.text_color = QColor(0, 0, 0) 
+        # Display strings of the font and colour, recomputed only when they change
+        self._font_display = self._format_font(self.text_font)
+        self._text_color_hex = self.text_color.name()
         self.text_outline_enabled = False 
         self.text_repetition_enabled = False 
 
         self.watermark_size_value = 15 
         self.watermark_opacity_value = 50 
         self.selected_watermark_type = "text" 
+        self.high_quality_encode = False # Slower JPEG/PNG settings for smaller artifacts or files
+        self.max_input_dim = 0 # Longest side large JPEGs are decoded at; 0 keeps the full size
+
+        # Settings live in a per-user folder, so they are found whatever folder the app is started from.
+        config_dir = os.path.expanduser("~/.config/image_watermarker")
+        self._settings_path = os.path.join(config_dir, "settings.ini")
+        # File written by earlier versions, read once if settings.ini does not exist yet
+        self._legacy_config_path = "watermarker_config.txt"
+
+        # Settings changes arrive per slider tick and keystroke; only the last one in a burst is written.
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(300)
+        self._save_timer.timeout.connect(self._save_settings_now)
+
+        # The file itself is written by a background thread, so a slow disk never blocks the GUI.
+        # Only the latest settings snapshot is kept; older ones not yet written are simply replaced.
+        self._pending_settings = None
+        self._last_saved_settings = None # Last snapshot handed to the writer, to skip unchanged saves
+        self._pending_settings_lock = threading.Lock()
+        self._settings_write_lock = threading.Lock()
+        self._settings_event = threading.Event()
+        threading.Thread(target=self._flush_settings_loop, daemon=True).start()
 
         self._create_widgets()
         self._load_last_settings() 
 
-        self.input_entry.setText(self.input_folder_path)
-        self.output_entry.setText(self.output_folder_path)
-        self.watermark_img_entry.setText(self.watermark_image_path)
-        self.watermark_text_entry_sender.setText(self.sender_text) 
-        self.watermark_text_entry_receiver.setText(self.receiver_text) 
-        self.font_label.setText(self.text_font.family() + ", " + str(self.text_font.pointSize()))
-        self.color_preview.setStyleSheet(f"background-color: {self.text_color.name()}; border: 1px solid black;")
-        self.size_slider.setValue(int(self.watermark_size_value))
-        self.opacity_slider.setValue(int(self.watermark_opacity_value))
-        self.text_outline_checkbox.setChecked(self.text_outline_enabled) 
-        if self.text_repetition_enabled:
-            self.repeat_text_radio.setChecked(True)
-        else:
-            self.single_text_radio.setChecked(True)
-
         if self.selected_watermark_type == "text":
             self.text_radio.setChecked(True)
         else:
             self.image_radio.setChecked(True)
+        # Connected only now, so restoring the last session does not run every change handler (and
+        # reschedule a save) once per setter. The labels the handlers would have updated are set by
+        # the _apply_* methods.
+        self._wire_signals()
         self._toggle_watermark_type() 
 
         self.worker_thread = None 
@@ -83,9 +122,8 @@ class WatermarkApp(QMainWindow):
         self.input_entry = QLineEdit(self.input_folder_path)
         self.input_entry.setReadOnly(True)
         input_layout.addWidget(self.input_entry)
-        browse_input_btn = QPushButton("Browse")
-        browse_input_btn.clicked.connect(self._browse_input_folder)
-        input_layout.addWidget(browse_input_btn)
+        self.browse_input_btn = QPushButton("Browse")
+        input_layout.addWidget(self.browse_input_btn)
         main_layout.addWidget(input_group)
 
         output_group = QGroupBox("Output Watermarked Images Folder")
@@ -93,9 +131,8 @@ class WatermarkApp(QMainWindow):
         self.output_entry = QLineEdit(self.output_folder_path)
         self.output_entry.setReadOnly(True)
         output_layout.addWidget(self.output_entry)
-        browse_output_btn = QPushButton("Browse")
-        browse_output_btn.clicked.connect(self._browse_output_folder)
-        output_layout.addWidget(browse_output_btn)
+        self.browse_output_btn = QPushButton("Browse")
+        output_layout.addWidget(self.browse_output_btn)
         main_layout.addWidget(output_group)
 
         type_group = QGroupBox("Select Watermark Type")
@@ -107,13 +144,112 @@ class WatermarkApp(QMainWindow):
         type_layout.addStretch(1) 
         main_layout.addWidget(type_group)
 
+        self.watermark_settings_stack = QStackedWidget()
+
+        # Only the page of the selected watermark type is built at startup; the other one is built
+        # by _toggle_watermark_type the first time it is shown.
+        self.image_settings_page = QWidget()
+        self.text_settings_page = QWidget()
+        self._image_page_built = False
+        self._text_page_built = False
+        self.watermark_settings_stack.addWidget(self.image_settings_page)
+        self.watermark_settings_stack.addWidget(self.text_settings_page)
+
+        main_layout.addWidget(self.watermark_settings_stack)
+
+        size_group = QGroupBox("Watermark Size")
+        size_layout = QVBoxLayout(size_group)
+        size_label_layout = QHBoxLayout()
+        size_label_layout.addWidget(QLabel("Watermark Size (% of smallest image dimension):"))
+        self.size_value_label = QLabel(f"{self.watermark_size_value:.0f}%")
+        size_label_layout.addWidget(self.size_value_label)
+        size_label_layout.addStretch(1)
+        size_layout.addLayout(size_label_layout)
+
+        self.size_slider = QSlider(Qt.Horizontal)
+        self.size_slider.setRange(5, 100)
+        self.size_slider.setValue(self.watermark_size_value)
+        self.size_slider.setTickPosition(QSlider.TicksBelow)
+        self.size_slider.setTickInterval(5)
+        size_layout.addWidget(self.size_slider)
+        main_layout.addWidget(size_group)
+
+        opacity_group = QGroupBox("Watermark Opacity")
+        opacity_layout = QVBoxLayout(opacity_group)
+        opacity_label_layout = QHBoxLayout()
+        opacity_label_layout.addWidget(QLabel("Watermark Opacity (%):"))
+        self.opacity_value_label = QLabel(f"{self.watermark_opacity_value:.0f}%")
+        opacity_label_layout.addWidget(self.opacity_value_label)
+        opacity_label_layout.addStretch(1)
+        opacity_layout.addLayout(opacity_label_layout)
+
+        self.opacity_slider = QSlider(Qt.Horizontal)
+        self.opacity_slider.setRange(20, 100) 
+        self.opacity_slider.setValue(self.watermark_opacity_value)
+        self.opacity_slider.setTickPosition(QSlider.TicksBelow)
+        self.opacity_slider.setTickInterval(5)
+        opacity_layout.addWidget(self.opacity_slider)
+        main_layout.addWidget(opacity_group)
+
+        self.high_quality_checkbox = QCheckBox("High-quality encode (slower)")
+        self.high_quality_checkbox.setChecked(self.high_quality_encode)
+        main_layout.addWidget(self.high_quality_checkbox)
+
+        max_dim_layout = QHBoxLayout()
+        max_dim_layout.addWidget(QLabel("Shrink large JPEGs to (longest side, px):"))
+        self.max_dim_spinbox = QSpinBox()
+        self.max_dim_spinbox.setRange(0, 20000)
+        self.max_dim_spinbox.setSingleStep(100)
+        self.max_dim_spinbox.setSpecialValueText("Full size")
+        self.max_dim_spinbox.setValue(self.max_input_dim)
+        max_dim_layout.addWidget(self.max_dim_spinbox)
+        max_dim_layout.addStretch(1)
+        main_layout.addLayout(max_dim_layout)
+
+        self.start_button = QPushButton("Start Watermarking")
+        main_layout.addWidget(self.start_button)
+
+        # --- Status Bar ---
+        self.statusBar = QStatusBar()
+        self.setStatusBar(self.statusBar)
+        self.statusBar.showMessage("Ready")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(150)
+        self.progress_bar.hide()
+        self.statusBar.addPermanentWidget(self.progress_bar)
+        if PILLOW_SIMD:
+            self.statusBar.addPermanentWidget(QLabel("Pillow-SIMD"))
+        else:
+            # Plain Pillow works, just slower; say so rather than leave users guessing which build runs.
+            pillow_label = QLabel("Pillow (no SIMD)")
+            pillow_label.setToolTip("Install pillow-simd for faster watermark resizing and compositing (see README).")
+            self.statusBar.addPermanentWidget(pillow_label)
+
+    def _wire_signals(self):
+        """
+        Connects the widgets built by _create_widgets. The lazily built settings pages connect their
+        own widgets when they are built.
+        """
+        self.browse_input_btn.clicked.connect(self._browse_input_folder)
+        self.browse_output_btn.clicked.connect(self._browse_output_folder)
         self.image_radio.toggled.connect(self._toggle_watermark_type)
         self.text_radio.toggled.connect(self._toggle_watermark_type)
+        self.size_slider.valueChanged.connect(self._update_size_label)
+        self.opacity_slider.valueChanged.connect(self._update_opacity_label)
+        self.high_quality_checkbox.stateChanged.connect(self._update_high_quality_encode)
+        self.max_dim_spinbox.valueChanged.connect(self._update_max_input_dim)
+        self.start_button.clicked.connect(self._start_watermarking)
 
-        self.watermark_settings_stack = QStackedWidget()
+    def _replace_settings_page(self, placeholder, page):
+        index = self.watermark_settings_stack.indexOf(placeholder)
+        self.watermark_settings_stack.removeWidget(placeholder)
+        placeholder.deleteLater()
+        self.watermark_settings_stack.insertWidget(index, page)
 
-        self.image_settings_page = QWidget()
-        image_settings_layout = QVBoxLayout(self.image_settings_page)
+    def _build_image_page(self):
+        page = QWidget()
+        image_settings_layout = QVBoxLayout(page)
         image_settings_layout.setContentsMargins(0, 0, 0, 0) 
 
         watermark_img_group = QGroupBox("Watermark Image File")
@@ -125,17 +261,21 @@ class WatermarkApp(QMainWindow):
         browse_watermark_btn.clicked.connect(self._browse_watermark_image)
         watermark_img_layout.addWidget(browse_watermark_btn)
         image_settings_layout.addWidget(watermark_img_group)
-        self.watermark_settings_stack.addWidget(self.image_settings_page)
 
-        self.text_settings_page = QWidget()
-        text_settings_layout = QVBoxLayout(self.text_settings_page)
+        self._replace_settings_page(self.image_settings_page, page)
+        self.image_settings_page = page
+        self._image_page_built = True
+
+    def _build_text_page(self):
+        page = QWidget()
+        text_settings_layout = QVBoxLayout(page)
         text_settings_layout.setContentsMargins(0, 0, 0, 0) 
 
         sender_text_group = QGroupBox("Sender Text")
         sender_text_layout = QVBoxLayout(sender_text_group)
         self.watermark_text_entry_sender = QLineEdit(self.sender_text)
         self.watermark_text_entry_sender.setPlaceholderText("Enter sender text...")
-        self.watermark_text_entry_sender.textChanged.connect(self._save_settings)
+        self.watermark_text_entry_sender.textChanged.connect(self._update_sender_text)
         sender_text_layout.addWidget(self.watermark_text_entry_sender)
         text_settings_layout.addWidget(sender_text_group)
 
@@ -143,7 +283,7 @@ class WatermarkApp(QMainWindow):
         receiver_text_layout = QVBoxLayout(receiver_text_group)
         self.watermark_text_entry_receiver = QLineEdit(self.receiver_text)
         self.watermark_text_entry_receiver.setPlaceholderText("Enter receiver text...")
-        self.watermark_text_entry_receiver.textChanged.connect(self._save_settings)
+        self.watermark_text_entry_receiver.textChanged.connect(self._update_receiver_text)
         receiver_text_layout.addWidget(self.watermark_text_entry_receiver)
         text_settings_layout.addWidget(receiver_text_group)
 
@@ -151,7 +291,7 @@ class WatermarkApp(QMainWindow):
 
         font_group = QGroupBox("Font")
         font_layout = QHBoxLayout(font_group)
-        self.font_label = QLabel(self.text_font.family() + ", " + str(self.text_font.pointSize()))
+        self.font_label = QLabel(self._font_display)
         font_layout.addWidget(self.font_label)
         select_font_btn = QPushButton("Select Font")
         select_font_btn.clicked.connect(self._select_font)
@@ -161,7 +301,7 @@ class WatermarkApp(QMainWindow):
         color_group = QGroupBox("Color")
         color_layout = QHBoxLayout(color_group)
         self.color_preview = QLabel("   ") 
-        self.color_preview.setStyleSheet(f"background-color: {self.text_color.name()}; border: 1px solid black;")
+        self.color_preview.setStyleSheet(self._COLOR_CSS % self._text_color_hex)
         color_layout.addWidget(self.color_preview)
         select_color_btn = QPushButton("Select Color")
         select_color_btn.clicked.connect(self._select_color)
@@ -187,61 +327,24 @@ class WatermarkApp(QMainWindow):
         self.single_text_radio.toggled.connect(self._toggle_text_repetition_mode)
         self.repeat_text_radio.toggled.connect(self._toggle_text_repetition_mode)
 
+        if self.text_repetition_enabled:
+            self.repeat_text_radio.setChecked(True)
+        else:
+            self.single_text_radio.setChecked(True)
 
-        self.watermark_settings_stack.addWidget(self.text_settings_page)
-
-        main_layout.addWidget(self.watermark_settings_stack)
-
-        size_group = QGroupBox("Watermark Size")
-        size_layout = QVBoxLayout(size_group)
-        size_label_layout = QHBoxLayout()
-        size_label_layout.addWidget(QLabel("Watermark Size (% of smallest image dimension):"))
-        self.size_value_label = QLabel(f"{self.watermark_size_value:.0f}%")
-        size_label_layout.addWidget(self.size_value_label)
-        size_label_layout.addStretch(1)
-        size_layout.addLayout(size_label_layout)
-
-        self.size_slider = QSlider(Qt.Horizontal)
-        self.size_slider.setRange(5, 100)
-        self.size_slider.setValue(self.watermark_size_value)
-        self.size_slider.setTickPosition(QSlider.TicksBelow)
-        self.size_slider.setTickInterval(5)
-        self.size_slider.valueChanged.connect(self._update_size_label)
-        size_layout.addWidget(self.size_slider)
-        main_layout.addWidget(size_group)
-
-        opacity_group = QGroupBox("Watermark Opacity")
-        opacity_layout = QVBoxLayout(opacity_group)
-        opacity_label_layout = QHBoxLayout()
-        opacity_label_layout.addWidget(QLabel("Watermark Opacity (%):"))
-        self.opacity_value_label = QLabel(f"{self.watermark_opacity_value:.0f}%")
-        opacity_label_layout.addWidget(self.opacity_value_label)
-        opacity_label_layout.addStretch(1)
-        opacity_layout.addLayout(opacity_label_layout)
-
-        self.opacity_slider = QSlider(Qt.Horizontal)
-        self.opacity_slider.setRange(20, 100) 
-        self.opacity_slider.setValue(self.watermark_opacity_value)
-        self.opacity_slider.setTickPosition(QSlider.TicksBelow)
-        self.opacity_slider.setTickInterval(5)
-        self.opacity_slider.valueChanged.connect(self._update_opacity_label)
-        opacity_layout.addWidget(self.opacity_slider)
-        main_layout.addWidget(opacity_group)
-
-        self.start_button = QPushButton("Start Watermarking")
-        self.start_button.clicked.connect(self._start_watermarking)
-        main_layout.addWidget(self.start_button)
-
-        # --- Status Bar ---
-        self.statusBar = QStatusBar()
-        self.setStatusBar(self.statusBar)
-        self.statusBar.showMessage("Ready")
+        self._replace_settings_page(self.text_settings_page, page)
+        self.text_settings_page = page
+        self._text_page_built = True
 
     def _toggle_watermark_type(self):
         if self.image_radio.isChecked():
+            if not self._image_page_built:
+                self._build_image_page()
             self.watermark_settings_stack.setCurrentWidget(self.image_settings_page)
             self.selected_watermark_type = "image"
         elif self.text_radio.isChecked():
+            if not self._text_page_built:
+                self._build_text_page()
             self.watermark_settings_stack.setCurrentWidget(self.text_settings_page)
             self.selected_watermark_type = "text"
         self._save_settings()
@@ -250,6 +353,14 @@ class WatermarkApp(QMainWindow):
         self.text_repetition_enabled = self.repeat_text_radio.isChecked()
         self._save_settings()
 
+    def _update_sender_text(self, text):
+        self.sender_text = text
+        self._save_settings()
+
+    def _update_receiver_text(self, text):
+        self.receiver_text = text
+        self._save_settings()
+
     def _update_size_label(self, value):
         self.watermark_size_value = value
         self.size_value_label.setText(f"{value:.0f}%")
@@ -264,6 +375,14 @@ class WatermarkApp(QMainWindow):
         self.text_outline_enabled = (state == Qt.Checked)
         self._save_settings()
 
+    def _update_high_quality_encode(self, state):
+        self.high_quality_encode = (state == Qt.Checked)
+        self._save_settings()
+
+    def _update_max_input_dim(self, value):
+        self.max_input_dim = value
+        self._save_settings()
+
     def _browse_input_folder(self):
         folder_selected = QFileDialog.getExistingDirectory(self, "Select Input Folder", self.input_folder_path)
         if folder_selected:
@@ -287,29 +406,47 @@ class WatermarkApp(QMainWindow):
         )
         if file_selected:
             self.watermark_image_path = file_selected
+            self._watermark_image_loaded = False
             self.watermark_img_entry.setText(file_selected)
             try:
-                self.watermarker.load_watermark_image(file_selected)
+                self._ensure_watermark_image_loaded()
                 self.statusBar.showMessage(f"Watermark image loaded: {os.path.basename(file_selected)}")
                 self._save_settings()
             except (FileNotFoundError, IOError) as e:
                 QMessageBox.critical(self, "Error Loading Watermark", str(e))
                 self.statusBar.showMessage("Error loading watermark.")
 
+    def _ensure_watermark_image_loaded(self):
+        """
+        Decodes the selected watermark image the first time it is needed, so a path restored from
+        the last session costs nothing at startup. Raises IOError if the image cannot be loaded.
+        """
+        if not self._watermark_image_loaded:
+            self.watermarker.load_watermark_image(self.watermark_image_path)
+            self._watermark_image_loaded = True
+
+    @staticmethod
+    def _format_font(font):
+        return font.family() + ", " + str(font.pointSize())
+
     def _select_font(self):
         font, ok = QFontDialog.getFont(self.text_font, self, "Select Font for Watermark")
         if ok:
             self.text_font = font
-            self.font_label.setText(font.family() + ", " + str(font.pointSize()))
+            self._font_display = self._format_font(font)
+            self.font_label.setText(self._font_display)
             self.statusBar.showMessage(f"Font set to: {font.family()}, {font.pointSize()}pt")
             self._save_settings()
 
     def _select_color(self):
         color = QColorDialog.getColor(self.text_color, self, "Select Color for Watermark")
         if color.isValid():
+            if color == self.text_color:
+                return # Same colour picked again; skip re-parsing the preview's stylesheet
             self.text_color = color
-            self.color_preview.setStyleSheet(f"background-color: {color.name()}; border: 1px solid black;")
-            self.statusBar.showMessage(f"Color set to: {color.name()}")
+            self._text_color_hex = color.name()
+            self.color_preview.setStyleSheet(self._COLOR_CSS % self._text_color_hex)
+            self.statusBar.showMessage(f"Color set to: {self._text_color_hex}")
             self._save_settings()
 
     def _start_watermarking(self):
@@ -331,13 +468,12 @@ class WatermarkApp(QMainWindow):
             if not watermark_path or not os.path.exists(watermark_path):
                 QMessageBox.critical(self, "Invalid Watermark", "Please select a valid watermark image.")
                 return
-            if self.watermarker.watermark_image is None:
+            try:
+                self._ensure_watermark_image_loaded()
+            except IOError:
                 QMessageBox.critical(self, "Watermark Not Loaded", "The watermark image failed to load. Please re-select.")
                 return
         elif watermark_type == "text":
-            self.sender_text = self.watermark_text_entry_sender.text()
-            self.receiver_text = self.watermark_text_entry_receiver.text()
-
             if not self.sender_text.strip() and not self.receiver_text.strip():
                 QMessageBox.critical(self, "Invalid Watermark Text", "Please enter text for either Sender or Receiver (or both).")
                 return
@@ -358,6 +494,8 @@ class WatermarkApp(QMainWindow):
 
         self.start_button.setEnabled(False) 
         self.statusBar.showMessage("Watermarking in progress...")
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
 
         self.worker = WatermarkWorker(
             input_folder,
@@ -366,19 +504,40 @@ class WatermarkApp(QMainWindow):
             self.watermark_size_value / 100.0, 
             self.watermark_opacity_value / 100.0,
             self.watermarker,
-            text_details 
+            text_details,
+            self.high_quality_encode,
+            self.max_input_dim or None
         )
         
-        self.signal_emitter = WorkerSignals()
-        self.signal_emitter.update_progress.connect(self.statusBar.showMessage)
-        self.signal_emitter.job_finished.connect(self._job_done)
-        self.worker.set_signal_emitter(self.signal_emitter) 
-
-        self.worker_thread = threading.Thread(target=self.worker.run)
+        # The signals are emitted from the worker thread; queue them explicitly so the slots always run
+        # on the GUI thread.
+        self.worker.update_progress.connect(self.statusBar.showMessage, Qt.QueuedConnection)
+        self.worker.progress_percent.connect(self.progress_bar.setValue, Qt.QueuedConnection)
+        self.worker.job_finished.connect(self._job_done, Qt.QueuedConnection)
+
+        # The worker lives in its own QThread; Qt quits the thread when the job ends and then deletes
+        # both, so finished jobs do not pile up threads for the rest of the session.
+        self.worker_thread = QThread(self)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.job_finished.connect(self.worker_thread.quit)
+        self.worker_thread.finished.connect(self._worker_thread_finished)
+        self.worker_thread.finished.connect(self.worker.deleteLater)
+        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
         self.worker_thread.start()
 
+    def _worker_thread_finished(self):
+        """
+        Drops the references to a finished job's thread and worker before Qt deletes them. A newer
+        job may already have started, so only the thread that sent the signal is forgotten.
+        """
+        if self.sender() is self.worker_thread:
+            self.worker_thread = None
+            self.worker = None
+
     def _job_done(self, processed_count, total_count, errors):
         self.start_button.setEnabled(True) 
+        self.progress_bar.hide()
         self.statusBar.showMessage("Watermarking complete.")
 
         message = f"Job Done! Watermarked {processed_count} of {total_count} images."
@@ -391,69 +550,203 @@ class WatermarkApp(QMainWindow):
 
         self._save_settings() 
 
-    def _save_settings(self):
-        config_path = "watermarker_config.txt"
-        with open(config_path, "w") as f:
-            f.write(f"input_folder={self.input_folder_path}\n")
-            f.write(f"output_folder={self.output_folder_path}\n")
-            f.write(f"selected_watermark_type={self.selected_watermark_type}\n")
-
-            f.write(f"watermark_image={self.watermark_image_path}\n")
-
-            f.write(f"sender_text={self.watermark_text_entry_sender.text()}\n")
-            f.write(f"receiver_text={self.watermark_text_entry_receiver.text()}\n")
-            f.write(f"text_font_family={self.text_font.family()}\n")
-            f.write(f"text_font_size={self.text_font.pointSize()}\n")
-            f.write(f"text_color={self.text_color.name()}\n") 
-            f.write(f"text_outline_enabled={self.text_outline_enabled}\n") 
-            f.write(f"text_repetition_enabled={self.text_repetition_enabled}\n") 
-
-            f.write(f"watermark_size={self.watermark_size_value}\n")
-            f.write(f"watermark_opacity={self.watermark_opacity_value}\n")
+    def closeEvent(self, event):
+        if self.worker_thread is not None and self.worker_thread.isRunning():
+            self.worker.stop()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            self._save_settings_now()
+        try:
+            self._write_pending_settings() # The flusher is a daemon thread, so write the last snapshot before exiting
+        except OSError as e:
+            print(f"Error saving settings: {e}")
+        super().closeEvent(event)
 
-    def _load_last_settings(self):
-        config_path = "watermarker_config.txt"
-        if os.path.exists(config_path):
+    def _save_settings(self):
+        """
+        Schedules a settings write; restarting the timer coalesces rapid changes into one write.
+        """
+        self._save_timer.start()
+
+    def _save_settings_now(self):
+        """
+        Hands a snapshot of the current settings to the background writer, unless nothing changed
+        since the last snapshot (e.g. a slider dragged back to where it was).
+        """
+        settings = self._settings_snapshot()
+        if settings == self._last_saved_settings:
+            return
+        self._last_saved_settings = settings
+        with self._pending_settings_lock:
+            self._pending_settings = settings
+        self._settings_event.set()
+
+    def _settings_snapshot(self):
+        return {
+            "input_folder": self.input_folder_path,
+            "output_folder": self.output_folder_path,
+            "selected_watermark_type": self.selected_watermark_type,
+
+            "watermark_image": self.watermark_image_path,
+
+            "sender_text": self.sender_text,
+            "receiver_text": self.receiver_text,
+            "text_font_family": self.text_font.family(),
+            "text_font_size": self.text_font.pointSize(),
+            "text_color": self._text_color_hex,
+            "text_outline_enabled": self.text_outline_enabled,
+            "text_repetition_enabled": self.text_repetition_enabled,
+
+            "watermark_size": self.watermark_size_value,
+            "watermark_opacity": self.watermark_opacity_value,
+            "high_quality_encode": self.high_quality_encode,
+            "max_input_dim": self.max_input_dim,
+        }
+
+    def _write_pending_settings(self):
+        """
+        Writes the latest settings snapshot, if there is one. Runs on the writer thread, and on the
+        GUI thread when the window closes; the write lock keeps an older snapshot from landing last.
+        """
+        with self._settings_write_lock:
+            with self._pending_settings_lock:
+                settings, self._pending_settings = self._pending_settings, None
+            if settings is not None:
+                # QSettings objects are per thread, so each write uses its own. sync() saves through a
+                # temporary file that replaces the old one, so a crash mid-write never truncates it.
+                store = QSettings(self._settings_path, QSettings.IniFormat)
+                for key, value in settings.items():
+                    store.setValue(key, value)
+                store.sync()
+                if store.status() != QSettings.NoError:
+                    raise OSError(f"Could not write '{self._settings_path}'")
+
+    def _flush_settings_loop(self):
+        while True:
+            self._settings_event.wait()
+            self._settings_event.clear()
             try:
-                with open(config_path, "r") as f:
-                    settings = {}
-                    for line in f:
-                        line = line.strip()
-                        if "=" in line:
-                            key, value = line.split("=", 1)
-                            settings[key] = value
-
-                self.input_folder_path = settings.get("input_folder", "")
-                self.output_folder_path = settings.get("output_folder", "")
-                self.selected_watermark_type = settings.get("selected_watermark_type", "text") 
-
-                self.watermark_image_path = settings.get("watermark_image", "")
-
-                self.sender_text = settings.get("sender_text", "")
-                self.receiver_text = settings.get("receiver_text", "")
-                
-                font_family = settings.get("text_font_family", "Arial")
-                font_size = int(settings.get("text_font_size", 24))
-                self.text_font = QFont(font_family, font_size)
-
-                self.text_color = QColor(settings.get("text_color", "#000000"))
-                self.text_outline_enabled = settings.get("text_outline_enabled", "False").lower() == "true"
-                self.text_repetition_enabled = settings.get("text_repetition_enabled", "False").lower() == "true" 
+                self._write_pending_settings()
+            except OSError as e:
+                print(f"Error saving settings: {e}")
+                self._last_saved_settings = None # Let the next save retry even if nothing changes
+
+    def _read_legacy_config(self):
+        """
+        Returns the settings from the config file of an earlier version, or None if there is none.
+        """
+        if not os.path.exists(self._legacy_config_path):
+            return None
+        with open(self._legacy_config_path, "r") as f:
+            return self._read_legacy_settings(f.read())
+
+    def _read_legacy_settings(self, data):
+        """
+        Parses the key=value text format written by earlier versions, so their settings are not lost.
+        """
+        settings = {}
+        for line in data.splitlines():
+            line = line.strip()
+            if "=" in line:
+                key, value = line.split("=", 1)
+                settings[key] = value
+        for key in ("text_outline_enabled", "text_repetition_enabled"):
+            if key in settings:
+                settings[key] = settings[key].lower() == "true"
+        return settings
+
+    def _settings_handlers(self):
+        """
+        Maps every settings key to the function that applies its value. Keys missing from the
+        file keep the defaults set in __init__.
+        """
+        return {
+            "input_folder": self._apply_input_folder,
+            "output_folder": self._apply_output_folder,
+            "selected_watermark_type": partial(setattr, self, "selected_watermark_type"),
+            "watermark_image": partial(setattr, self, "watermark_image_path"),
+            "sender_text": partial(setattr, self, "sender_text"),
+            "receiver_text": partial(setattr, self, "receiver_text"),
+            "text_font_family": self._apply_text_font_family,
+            "text_font_size": self._apply_text_font_size,
+            "text_color": self._apply_text_color,
+            "text_outline_enabled": partial(setattr, self, "text_outline_enabled"),
+            "text_repetition_enabled": partial(setattr, self, "text_repetition_enabled"),
+            "watermark_size": self._apply_watermark_size,
+            "watermark_opacity": self._apply_watermark_opacity,
+            "high_quality_encode": self._apply_high_quality_encode,
+            "max_input_dim": self._apply_max_input_dim,
+        }
+
+    def _apply_input_folder(self, value):
+        self.input_folder_path = value
+        self.input_entry.setText(value)
+
+    def _apply_output_folder(self, value):
+        self.output_folder_path = value
+        self.output_entry.setText(value)
+
+    def _apply_text_font_family(self, value):
+        self.text_font.setFamily(value)
+        self._font_display = self._format_font(self.text_font)
+
+    def _apply_text_font_size(self, value):
+        self.text_font.setPointSize(int(value))
+        self._font_display = self._format_font(self.text_font)
+
+    def _apply_text_color(self, value):
+        self.text_color = QColor(value)
+        self._text_color_hex = self.text_color.name()
+
+    def _apply_watermark_size(self, value):
+        self.watermark_size_value = float(value)
+        self.size_slider.setValue(int(self.watermark_size_value))
+        self.size_value_label.setText(f"{self.watermark_size_value:.0f}%")
 
-                self.watermark_size_value = float(settings.get("watermark_size", 15))
-                self.watermark_opacity_value = float(settings.get("watermark_opacity", 50))
+    def _apply_watermark_opacity(self, value):
+        self.watermark_opacity_value = float(value)
+        self.opacity_slider.setValue(int(self.watermark_opacity_value))
+        self.opacity_value_label.setText(f"{self.watermark_opacity_value:.0f}%")
 
-                self.statusBar.showMessage("Loaded last session settings.")
-            except Exception as e:
-                print(f"Error loading settings: {e}")
-                self.statusBar.showMessage("Could not load previous settings.")
+    def _apply_high_quality_encode(self, value):
+        self.high_quality_encode = value
+        self.high_quality_checkbox.setChecked(value)
 
-class WorkerSignals(QObject):
-    update_progress = pyqtSignal(str)
-    job_finished = pyqtSignal(int, int, list)
+    def _apply_max_input_dim(self, value):
+        self.max_input_dim = int(value)
+        self.max_dim_spinbox.setValue(self.max_input_dim)
 
+    def _load_last_settings(self):
+        try:
+            store = QSettings(self._settings_path, QSettings.IniFormat)
+            migrated = not store.allKeys()
+            if migrated:
+                settings = self._read_legacy_config()
+                if settings is None:
+                    return
+            else:
+                settings = {key: store.value(key, type=value_type)
+                            for key, value_type in self._SETTINGS_TYPES.items() if store.contains(key)}
+
+            handlers = self._settings_handlers()
+            for key, value in settings.items():
+                handler = handlers.get(key)
+                if handler:
+                    handler(value)
+            if migrated:
+                self._save_settings_now() # Copy the old file's settings into settings.ini
+            else:
+                self._last_saved_settings = self._settings_snapshot()
+
+            self.statusBar.showMessage("Loaded last session settings.")
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+            self.statusBar.showMessage("Could not load previous settings.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # The worker's process pool re-launches this script when frozen into an .exe
     app = QApplication(sys.argv)
     window = WatermarkApp()
     window.show()
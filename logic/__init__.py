@@ -1,2 +1,2 @@
-from .imagewatermarker import ImageWatermarker 
+from .imagewatermarker import ImageWatermarker, PILLOW_SIMD 
 from .watermarkworker import WatermarkWorker
\ No newline at end of file
@@ -1,250 +1,579 @@
+import PIL
 from PIL import Image, ImageDraw, ImageFont
+from PIL.JpegImagePlugin import JpegImageFile
+import numpy as np
+import math
+import io
 import os
+import shutil
 import glob 
+from collections import OrderedDict
 from PyQt5.QtCore import QObject, pyqtSignal 
 
+try:
+    from numba import njit
+except ImportError: # numba is optional, _composite_tiled falls back to NumPy without it
+    njit = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJPF_GRAY, TJSAMP_420, TJSAMP_GRAY
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError): # PyTurboJPEG and the libturbojpeg library it loads are optional
+    _turbo_jpeg = None
+
+# Pillow-SIMD publishes its releases as ".postN" versions of the Pillow release it is based on.
+PILLOW_SIMD = ".post" in PIL.__version__
+# Pillow-SIMD vectorizes Lanczos, so it keeps the sharper filter; plain Pillow uses the cheaper bilinear
+# filter, which is still antialiased when shrinking and hard to tell apart at watermark sizes.
+WATERMARK_RESAMPLE = Image.LANCZOS if PILLOW_SIMD else Image.BILINEAR
+
+WATERMARK_MAX_SIDE = 4096 # Watermark images are decoded at no less than this size, when the format can scale
+SCALED_WATERMARK_CACHE_SIZE = 32 # Resized watermark images kept, least recently used dropped first
+TEXT_IMAGE_CACHE_SIZE = 32 # Rendered text images kept, least recently used dropped first
+FONT_CACHE_SIZE = 16 # Loaded fonts kept, least recently used dropped first
+TEXT_BBOX_CACHE_SIZE = 64 # Measured text boxes kept, least recently used dropped first
+
+
+def _blend_tiled_kernel(base, tile, origin_x, origin_y):
+    """
+    Porter-Duff "over" of a repeating RGBA tile onto an RGBA or RGB base array, in place.
+    An RGB base is treated as fully opaque. Only fast once compiled by numba; without numba the
+    NumPy path in _composite_tiled is used.
+    """
+    img_height, img_width = base.shape[0], base.shape[1]
+    tile_height, tile_width = tile.shape[0], tile.shape[1]
+    has_alpha = base.shape[2] == 4
+    # The tile column of every image column is the same on every row, so it is looked up once.
+    tile_cols = np.empty(img_width, np.intp)
+    for x in range(img_width):
+        tile_cols[x] = (x - origin_x) % tile_width
+    for y in range(img_height):
+        tile_row = tile[(y - origin_y) % tile_height]
+        base_row = base[y]
+        for x in range(img_width):
+            tile_pixel = tile_row[tile_cols[x]]
+            wm_alpha = np.uint32(tile_pixel[3])
+            if wm_alpha == 0:
+                continue
+            base_alpha = np.uint32(base_row[x, 3]) if has_alpha else np.uint32(255)
+            base_weight = base_alpha * (255 - wm_alpha)
+            out_alpha = wm_alpha * 255 + base_weight
+            for c in range(3):
+                base_row[x, c] = (np.uint32(tile_pixel[c]) * wm_alpha * 255
+                                  + np.uint32(base_row[x, c]) * base_weight + out_alpha // 2) // out_alpha
+            if has_alpha:
+                base_row[x, 3] = (out_alpha + 127) // 255
+
+if njit is not None:
+    _blend_tiled_kernel = njit(cache=True, nogil=True)(_blend_tiled_kernel)
+
+
+def warm_up_blend():
+    """
+    Compiles (or loads from numba's cache) the blend kernel on a 1-pixel image, so the first real
+    image does not pay for it. Does nothing without numba.
+    """
+    if njit is not None:
+        # Same array types as _composite_tiled: a writable base and the read-only view np.asarray gives
+        # of the tile. numba compiles a separate version for writable arrays, which would go unused.
+        pixel = np.zeros((1, 1, 4), np.uint8)
+        tile = np.asarray(Image.new("RGBA", (1, 1)))
+        _blend_tiled_kernel(pixel, tile, 0, 0)
+
+
 class ImageWatermarker:
-    def __init__(self):
+    def __init__(self, watermark_path=None):
         self.watermark_image = None 
+        self.watermark_image_path = None # File the watermark image was loaded from
+        self._scaled_watermark_cache = OrderedDict() # (width, height, opacity) -> resized, opacity-adjusted watermark
+        self._font_cache = OrderedDict() # (font family, pixel size) -> loaded font
+        self._text_img_cache = OrderedDict() # (text, font family, pixel size, colours, outline) -> rendered text image
+        self._text_bbox_cache = OrderedDict() # (text, font family, pixel size) -> text bounding box
+        if watermark_path:
+            self.load_watermark_image(watermark_path)
 
     def load_watermark_image(self, path):
         try:
-            self.watermark_image = Image.open(path).convert("RGBA")
+            with Image.open(path) as source:
+                # JPEG watermarks far larger than any watermark is drawn are decoded at 1/2, 1/4 or 1/8
+                # scale by libjpeg itself; other formats ignore draft().
+                source.draft("RGB", (WATERMARK_MAX_SIDE, WATERMARK_MAX_SIDE))
+                self.watermark_image = source.convert("RGBA")
+            self.watermark_image_path = path
+            self._scaled_watermark_cache.clear()
         except Exception as e:
             raise IOError(f"Failed to load watermark image: {e}")
 
-    def apply_watermark_image(self, input_path, output_path, size_ratio, opacity_ratio):
+    def apply(self, input_path, output_path, watermark_type, size_ratio, opacity_ratio, text_details=None,
+              high_quality=False, max_input_dim=None, get_watermark=None):
         """
-        Applies an image watermark to an image.
+        Watermarks one file with an image or text watermark and saves the result.
+        A file with nothing to draw on it is copied as-is. JPEGs whose longest side exceeds max_input_dim
+        are decoded at a reduced scale. get_watermark(base_size) can supply the prepared watermark, e.g.
+        from a cache; by default it is prepared with prepare_watermark.
         """
-        try:
-            base_image = Image.open(input_path).convert("RGBA")
-            if self.watermark_image is None:
-                raise ValueError("Watermark image not loaded. Please select one.")
-
-            img_width, img_height = base_image.size
-            wm_width, wm_height = self.watermark_image.size
-            target_wm_size = int(min(img_width, img_height) * size_ratio)
-            if wm_width > wm_height:
-                new_wm_width = target_wm_size
-                new_wm_height = int(wm_height * (new_wm_width / wm_width))
+        # Image.open only reads the header, so the watermark is prepared before any pixel is decoded.
+        with Image.open(input_path) as source_image:
+            longest_side = max(source_image.size)
+            # Phone photos carrying multi-picture data open as MPO, which is a JPEG subclass.
+            if max_input_dim and isinstance(source_image, JpegImageFile) and longest_side > max_input_dim:
+                # libjpeg decodes straight at 1/2, 1/4 or 1/8 scale, never below the requested size.
+                scale = max_input_dim / longest_side
+                source_image.draft(None, (max(1, int(source_image.width * scale)),
+                                          max(1, int(source_image.height * scale))))
+            if get_watermark is not None:
+                watermark = get_watermark(source_image.size)
             else:
-                new_wm_height = target_wm_size
-                new_wm_width = int(wm_width * (new_wm_height / wm_height)) 
-            
-            new_wm_width = max(1, new_wm_width)
-            new_wm_height = max(1, new_wm_height)
-
-            resized_watermark = self.watermark_image.resize((new_wm_width, new_wm_height), Image.LANCZOS)
-
-            alpha = resized_watermark.split()[-1]
-            alpha = Image.eval(alpha, lambda x: x * opacity_ratio)
-            resized_watermark.putalpha(alpha)
-
-            padding = 20 
-            paste_x = img_width - new_wm_width - padding
-            paste_y = img_height - new_wm_height - padding
+                watermark = self.prepare_watermark(source_image.size, watermark_type, size_ratio, opacity_ratio,
+                                                   text_details)
+            if watermark is None:
+                # Nothing to draw: copy the file as-is rather than decoding and re-encoding it.
+                shutil.copyfile(input_path, output_path)
+                return
+            original_mode = source_image.mode
+            base_image = source_image.convert(self.working_mode(original_mode, watermark))
 
-            paste_x = max(0, paste_x)
-            paste_y = max(0, paste_y)
+        watermarked_image = self.apply_prepared(base_image, watermark)
+        self.save_watermarked(watermarked_image, output_path, original_mode, high_quality)
 
-            base_image.paste(resized_watermark, (paste_x, paste_y), resized_watermark)
-            base_image.save(output_path)
+    def apply_watermark_image(self, input_path, output_path, size_ratio, opacity_ratio):
+        """
+        Applies an image watermark to an image.
+        """
+        try:
+            self.apply(input_path, output_path, "image", size_ratio, opacity_ratio)
         except Exception as e:
             raise Exception(f"Failed to apply image watermark: {e}")
 
-
     def apply_watermark_text(self, input_path, output_path, text_details, size_ratio, opacity_ratio):
         """
         Applies text watermarks (sender and receiver) to an image.
         Can apply as a single centered text or a repeated pattern.
         """
         try:
-            base_image = Image.open(input_path).convert("RGBA")
-            img_width, img_height = base_image.size
-            watermark_layer = Image.new('RGBA', base_image.size, (255, 255, 255, 0))
-            draw = ImageDraw.Draw(watermark_layer)
-            font_family = text_details.get('font_family', 'Arial')
-            font_size_pt = text_details.get('font_size_pt', 24) 
-            base_font_pixel_size = int(img_height * size_ratio * 0.1)
-            if base_font_pixel_size < 10: 
-                base_font_pixel_size = 10
-            try:
-                font = ImageFont.truetype(font_family, base_font_pixel_size)
-            except IOError:
+            self.apply(input_path, output_path, "text", size_ratio, opacity_ratio, text_details)
+        except Exception as e:
+            raise Exception(f"Failed to apply text watermark: {e}")
+
+    def _get_font(self, font_family, font_pixel_size):
+        """
+        Returns the font for a family and pixel size, loading it only once.
+        Loading parses the font file (and a failed lookup may search the system font folders),
+        so this matters when a batch has many images.
+        """
+        cache_key = (font_family, font_pixel_size)
+        font = self._font_cache.get(cache_key)
+        if font is not None:
+            self._font_cache.move_to_end(cache_key)
+        else:
+            for font_file in self._font_file_candidates(font_family):
+                try:
+                    font = ImageFont.truetype(font_file, font_pixel_size)
+                    break
+                except IOError:
+                    pass
+            else:
                 print(f"Warning: Font '{font_family}' not found. Using Arial. Ensure 'arial.ttf' is accessible.")
                 try:
-                    font = ImageFont.truetype("arial.ttf", base_font_pixel_size)
+                    font = ImageFont.truetype("arial.ttf", font_pixel_size)
                 except IOError:
                     print("Error: 'arial.ttf' not found. Text watermark may not be applied or may use a generic font.")
                     font = ImageFont.load_default() 
-                    
-            sender_text = text_details.get('sender_text', '')
-            receiver_text = text_details.get('receiver_text', '')
-            color_rgb = text_details.get('color_rgb', (0, 0, 0))
-            outline_enabled = text_details.get('outline_enabled', False)
-            repetition_enabled = text_details.get('repetition_enabled', False) 
-
-            opacity = int(255 * opacity_ratio)
-            fill_color = color_rgb + (opacity,)
-            outline_color = (0, 0, 0, opacity) 
-
-            text_lines = []
-            if sender_text.strip():
-                text_lines.append(sender_text)
-
-            if receiver_text.strip():
-                text_lines.append(receiver_text)
-            
-            if not text_lines: 
-                return
-
-            if repetition_enabled:
-                combined_text = ""
-                if len(text_lines) == 2:
-                    combined_text = f"{text_lines[0]} | {text_lines[1]}"
-
-                elif len(text_lines) == 1:
-                    combined_text = text_lines[0]
-                
-                if not combined_text.strip(): 
-                    return
-                
-                dummy_draw = ImageDraw.Draw(Image.new('RGBA', (1,1)))
-                bbox = dummy_draw.textbbox((0,0), combined_text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                horizontal_spacing = text_width + 50 
-                vertical_spacing = text_height + 50 
-                num_repeats_x = int(img_width / horizontal_spacing) + 2
-                num_repeats_y = int(img_height / vertical_spacing) + 2
-                start_x = (img_width - (num_repeats_x * horizontal_spacing - 50)) / 2
-                start_y = (img_height - (num_repeats_y * vertical_spacing - 50)) / 2
-
-                for row in range(num_repeats_y):
-                    for col in range(num_repeats_x):
-                        x_pos = start_x + col * horizontal_spacing
-                        y_pos = start_y + row * vertical_spacing
-
-                        if outline_enabled:
-                            outline_thickness = max(1, int(base_font_pixel_size * 0.05))
-                            for dx in range(-outline_thickness, outline_thickness + 1):
-                                for dy in range(-outline_thickness, outline_thickness + 1):
-                                    if dx != 0 or dy != 0:
-                                        draw.text((x_pos + dx, y_pos + dy), combined_text, font=font, fill=outline_color)
-                            draw.text((x_pos, y_pos), combined_text, font=font, fill=(color_rgb[0], color_rgb[1], color_rgb[2], 0))
-
-                        else:
-                            draw.text((x_pos, y_pos), combined_text, font=font, fill=fill_color)
-
-            else:
-                text1 = text_lines[0] if len(text_lines) > 0 else ""
-                text2 = text_lines[1] if len(text_lines) > 1 else ""
-
-                bbox1 = draw.textbbox((0,0), text1, font=font)
-                text1_width = bbox1[2] - bbox1[0]
-                text1_height = bbox1[3] - bbox1[1]
-
-                text2_width = 0
-                text2_height = 0
-                if text2:
-                    bbox2 = draw.textbbox((0,0), text2, font=font)
-                    text2_width = bbox2[2] - bbox2[0]
-                    text2_height = bbox2[3] - bbox2[1]
+            # The pixel size follows each base image's height, so only the most recently used sizes are kept.
+            self._font_cache[cache_key] = font
+            if len(self._font_cache) > FONT_CACHE_SIZE:
+                self._font_cache.popitem(last=False)
+        return font
+
+    @staticmethod
+    def _font_file_candidates(font_family):
+        """
+        Yields the names to try for a Qt font family. Pillow looks up plain file names in the system
+        font folders, so "DejaVu Sans" is also tried as "DejaVuSans.ttf" and "dejavusans.ttf".
+        """
+        yield font_family
+        compact = font_family.replace(" ", "")
+        yield f"{compact}.ttf"
+        if compact.lower() != compact:
+            yield f"{compact.lower()}.ttf"
 
-                max_text_width = max(text1_width, text2_width)
+    def _get_text_bbox(self, text, font_family, font_pixel_size):
+        """
+        Returns the bounding box of text drawn at (0, 0). The sender and receiver text stay the same
+        for the whole batch, so each text is measured only once per font size.
+        """
+        cache_key = (text, font_family, font_pixel_size)
+        bbox = self._text_bbox_cache.get(cache_key)
+        if bbox is not None:
+            self._text_bbox_cache.move_to_end(cache_key)
+        else:
+            # The same box ImageDraw.textbbox gives at (0, 0), without a throwaway image and draw context.
+            bbox = tuple(self._get_font(font_family, font_pixel_size).getbbox(text))
+            self._text_bbox_cache[cache_key] = bbox
+            if len(self._text_bbox_cache) > TEXT_BBOX_CACHE_SIZE:
+                self._text_bbox_cache.popitem(last=False)
+        return bbox
+
+    def _get_text_image(self, text, font_family, font_pixel_size, fill_color, outline_color, outline_thickness,
+                        start=(0.0, 0.0)):
+        """
+        Returns the rendered text (with its outline, if any) on a tight transparent image, and the
+        whole-pixel position of the text origin inside it. start is the sub-pixel part of the origin,
+        rendered into the image as ImageDraw.text does. Rendered once per text, font, colour and start,
+        since the layout and the outline passes are the expensive part of drawing text.
+        """
+        cache_key = (text, font_family, font_pixel_size, fill_color, outline_color, outline_thickness, start)
+        cached = self._text_img_cache.get(cache_key)
+        if cached is not None:
+            self._text_img_cache.move_to_end(cache_key)
+            return cached
+
+        font = self._get_font(font_family, font_pixel_size)
+        bbox = self._get_text_bbox(text, font_family, font_pixel_size)
+        # One spare pixel on every side for the sub-pixel start, which may be negative.
+        margin = outline_thickness + 1
+        text_x = margin - bbox[0]
+        text_y = margin - bbox[1]
+        # ImageDraw.text renders a fraction slightly differently on either side of 0, so a positive
+        # start is drawn at a non-negative origin, like the position it stands for.
+        if start[0] > 0:
+            text_x = max(text_x, 0)
+        if start[1] > 0:
+            text_y = max(text_y, 0)
+        text_img = Image.new('RGBA', (text_x + bbox[2] + margin, text_y + bbox[3] + margin), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(text_img)
+        # Pillow strokes the glyphs itself and then draws the fill over the stroke in the same call.
+        draw.text((text_x + start[0], text_y + start[1]), text, font=font, fill=fill_color,
+                  stroke_width=outline_thickness, stroke_fill=outline_color)
+
+        # Every base image height gives a new font size, so only the most recently used renders are kept.
+        self._text_img_cache[cache_key] = (text_img, (text_x, text_y))
+        if len(self._text_img_cache) > TEXT_IMAGE_CACHE_SIZE:
+            self._text_img_cache.popitem(last=False)
+        return text_img, (text_x, text_y)
+
+    def _draw_text(self, layer, position, text, font_family, font_pixel_size, fill_color, outline_color,
+                   outline_thickness):
+        """
+        Composites text rendered by _get_text_image onto a layer with the text origin at position,
+        which may be fractional, as ImageDraw.text would draw it there. Parts falling outside the
+        layer are clipped.
+        """
+        # ImageDraw.text splits the position the same way: truncated whole pixels plus a signed fraction.
+        start_x, whole_x = math.modf(position[0])
+        start_y, whole_y = math.modf(position[1])
+        text_img, (text_x, text_y) = self._get_text_image(text, font_family, font_pixel_size, fill_color, outline_color,
+                                                          outline_thickness, (start_x, start_y))
+        x = int(whole_x) - text_x
+        y = int(whole_y) - text_y
+        if x >= layer.width or y >= layer.height or x + text_img.width <= 0 or y + text_img.height <= 0:
+            return
+        layer.alpha_composite(text_img, (max(x, 0), max(y, 0)), (max(-x, 0), max(-y, 0)))
+
+    def _prepare_text_watermark(self, base_size, text_details, size_ratio, opacity_ratio):
+        """
+        Renders the sender/receiver text for a base image of the given size: a cell tile for the
+        repeated pattern, or a transparent layer cropped to the text otherwise.
+        Returns None when there is no text to draw.
+        """
+        img_width, img_height = base_size
+        font_family = text_details.get('font_family', 'Arial')
+        font_size_pt = text_details.get('font_size_pt', 24) 
+        base_font_pixel_size = int(img_height * size_ratio * 0.1)
+        if base_font_pixel_size < 10: 
+            base_font_pixel_size = 10
                 
-                total_text_block_height = text1_height
-                line_gap = 10 
-                if text2:
-                    total_text_block_height += text2_height + line_gap
-
-                start_x = (img_width - max_text_width) / 2
-                start_y = (img_height - total_text_block_height) / 2
-
-                if text1.strip():
-                    x1_pos = (img_width - text1_width) / 2
-                    y1_pos = start_y
-
-                    if outline_enabled:
-                        outline_thickness = max(1, int(base_font_pixel_size * 0.05))
-                        for dx in range(-outline_thickness, outline_thickness + 1):
-                            for dy in range(-outline_thickness, outline_thickness + 1):
-                                if dx != 0 or dy != 0:
-                                    draw.text((x1_pos + dx, y1_pos + dy), text1, font=font, fill=outline_color)
-                        draw.text((x1_pos, y1_pos), text1, font=font, fill=(color_rgb[0], color_rgb[1], color_rgb[2], 0))
-                    else:
-                        draw.text((x1_pos, y1_pos), text1, font=font, fill=fill_color)
-
-                if text2.strip():
-                    x2_pos = (img_width - text2_width) / 2
-                    y2_pos = start_y + text1_height + line_gap
-
-                    if outline_enabled:
-                        outline_thickness = max(1, int(base_font_pixel_size * 0.05))
-                        for dx in range(-outline_thickness, outline_thickness + 1):
-                            for dy in range(-outline_thickness, outline_thickness + 1):
-                                if dx != 0 or dy != 0:
-                                    draw.text((x2_pos + dx, y2_pos + dy), text2, font=font, fill=outline_color)
-                        draw.text((x2_pos, y2_pos), text2, font=font, fill=(color_rgb[0], color_rgb[1], color_rgb[2], 0))
-                    else:
-                        draw.text((x2_pos, y2_pos), text2, font=font, fill=fill_color)
-
-            watermarked_image = Image.alpha_composite(base_image, watermark_layer)
-            watermarked_image.save(output_path)
-
-        except Exception as e:
-            raise Exception(f"Failed to apply text watermark: {e}")
+        sender_text = text_details.get('sender_text', '')
+        receiver_text = text_details.get('receiver_text', '')
+        color_rgb = text_details.get('color_rgb', (0, 0, 0))
+        outline_enabled = text_details.get('outline_enabled', False)
+        repetition_enabled = text_details.get('repetition_enabled', False) 
+
+        opacity = int(255 * opacity_ratio)
+        fill_color = color_rgb + (opacity,)
+        outline_color = (0, 0, 0, opacity) 
+        outline_thickness = max(1, int(base_font_pixel_size * 0.05)) if outline_enabled else 0
+        # With an outline only the outline is visible; the letters themselves are left transparent.
+        text_fill = (color_rgb[0], color_rgb[1], color_rgb[2], 0) if outline_enabled else fill_color
+
+        text_lines = []
+        if sender_text.strip():
+            text_lines.append(sender_text)
+
+        if receiver_text.strip():
+            text_lines.append(receiver_text)
         
-    def __init__(self):
-        self.watermark_image = None 
+        if not text_lines: 
+            return None
 
-    def load_watermark_image(self, path):
-        try:
-            self.watermark_image = Image.open(path).convert("RGBA")
-        except Exception as e:
-            raise IOError(f"Failed to load watermark image: {e}")
+        if repetition_enabled:
+            combined_text = ""
+            if len(text_lines) == 2:
+                combined_text = f"{text_lines[0]} | {text_lines[1]}"
 
-    def apply_watermark_image(self, input_path, output_path, size_ratio, opacity_ratio):
+            elif len(text_lines) == 1:
+                combined_text = text_lines[0]
+            
+            if not combined_text.strip(): 
+                return None
+            
+            bbox = self._get_text_bbox(combined_text, font_family, base_font_pixel_size)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            horizontal_spacing = text_width + 50 
+            vertical_spacing = text_height + 50 
+            num_repeats_x = int(img_width / horizontal_spacing) + 2
+            num_repeats_y = int(img_height / vertical_spacing) + 2
+            start_x = (img_width - (num_repeats_x * horizontal_spacing - 50)) / 2
+            start_y = (img_height - (num_repeats_y * vertical_spacing - 50)) / 2
+
+            # Every cell of the pattern is identical, so the text is drawn once into a cell-sized
+            # tile which apply_prepared repeats over the whole image.
+            tile_width = int(horizontal_spacing)
+            tile_height = int(vertical_spacing)
+            origin_x = math.floor(start_x)
+            origin_y = math.floor(start_y)
+            tile = Image.new('RGBA', (tile_width, tile_height), (255, 255, 255, 0))
+
+            # Text spilling over a cell edge shows up in the neighbouring cell, so it is wrapped around.
+            for row in (-1, 0, 1):
+                for col in (-1, 0, 1):
+                    x_pos = start_x - origin_x + col * tile_width
+                    y_pos = start_y - origin_y + row * tile_height
+                    if (x_pos + bbox[2] + outline_thickness <= 0 or x_pos + bbox[0] - outline_thickness >= tile_width or
+                            y_pos + bbox[3] + outline_thickness <= 0 or y_pos + bbox[1] - outline_thickness >= tile_height):
+                        continue
+                    self._draw_text(tile, (x_pos, y_pos), combined_text, font_family, base_font_pixel_size,
+                                    text_fill, outline_color, outline_thickness)
+
+            return tile, (origin_x, origin_y), True
+
+        else:
+            watermark_layer = Image.new('RGBA', base_size, (255, 255, 255, 0))
+            text1 = text_lines[0] if len(text_lines) > 0 else ""
+            text2 = text_lines[1] if len(text_lines) > 1 else ""
+
+            bbox1 = self._get_text_bbox(text1, font_family, base_font_pixel_size)
+            text1_width = bbox1[2] - bbox1[0]
+            text1_height = bbox1[3] - bbox1[1]
+
+            text2_width = 0
+            text2_height = 0
+            if text2:
+                bbox2 = self._get_text_bbox(text2, font_family, base_font_pixel_size)
+                text2_width = bbox2[2] - bbox2[0]
+                text2_height = bbox2[3] - bbox2[1]
+
+            max_text_width = max(text1_width, text2_width)
+            
+            total_text_block_height = text1_height
+            line_gap = 10 
+            if text2:
+                total_text_block_height += text2_height + line_gap
+
+            start_x = (img_width - max_text_width) / 2
+            start_y = (img_height - total_text_block_height) / 2
+
+            if text1.strip():
+                x1_pos = (img_width - text1_width) / 2
+                y1_pos = start_y
+                self._draw_text(watermark_layer, (x1_pos, y1_pos), text1, font_family, base_font_pixel_size,
+                                text_fill, outline_color, outline_thickness)
+
+            if text2.strip():
+                x2_pos = (img_width - text2_width) / 2
+                y2_pos = start_y + text1_height + line_gap
+                self._draw_text(watermark_layer, (x2_pos, y2_pos), text2, font_family, base_font_pixel_size,
+                                text_fill, outline_color, outline_thickness)
+
+        # Only the part with text is kept, so applying it touches that region of the base image instead
+        # of blending a mostly transparent full-size layer.
+        text_box = watermark_layer.getbbox()
+        if text_box is None:
+            return None
+        return watermark_layer.crop(text_box), text_box[:2], False
+        
+    def _prepare_image_watermark(self, base_size, size_ratio, opacity_ratio):
         """
-        Applies an image watermark to an image.
+        Resizes the watermark image for a base image of the given size and applies the opacity.
         """
-        try:
-            base_image = Image.open(input_path).convert("RGBA")
+        img_width, img_height = base_size
+        wm_width, wm_height = self.watermark_image.size
+        target_wm_size = int(min(img_width, img_height) * size_ratio)
+        
+        if wm_width > wm_height:
+            new_wm_width = target_wm_size
+            new_wm_height = int(wm_height * (new_wm_width / wm_width))
+        else:
+            new_wm_height = target_wm_size
+            new_wm_width = int(wm_width * (new_wm_height / wm_height)) 
+        
+        new_wm_width = max(1, new_wm_width)
+        new_wm_height = max(1, new_wm_height)
+
+        # Many base sizes share a target size (e.g. portrait and landscape shots of one camera),
+        # so the resize is keyed on the target size rather than the base size.
+        cache_key = (new_wm_width, new_wm_height, opacity_ratio)
+        resized_watermark = self._scaled_watermark_cache.get(cache_key)
+        if resized_watermark is not None:
+            self._scaled_watermark_cache.move_to_end(cache_key)
+        else:
+            resized_watermark = self.watermark_image.resize((new_wm_width, new_wm_height), WATERMARK_RESAMPLE)
+
+            if opacity_ratio >= 1.0 and resized_watermark.getchannel("A").getextrema() == (255, 255):
+                # Fully opaque: dropping the alpha channel lets apply_prepared paste it without blending.
+                resized_watermark = resized_watermark.convert("RGB")
+            else:
+                opacity_table = [round(value * opacity_ratio) for value in range(256)]
+                alpha = resized_watermark.getchannel("A").point(opacity_table)
+                resized_watermark.putalpha(alpha)
+            self._scaled_watermark_cache[cache_key] = resized_watermark
+            if len(self._scaled_watermark_cache) > SCALED_WATERMARK_CACHE_SIZE:
+                self._scaled_watermark_cache.popitem(last=False)
+        padding = 20 
+        paste_x = img_width - new_wm_width - padding
+        paste_y = img_height - new_wm_height - padding
+
+        paste_x = max(0, paste_x)
+        paste_y = max(0, paste_y)
+
+        return resized_watermark, (paste_x, paste_y), False
+
+    def prepare_watermark(self, base_size, watermark_type, size_ratio, opacity_ratio, text_details=None):
+        """
+        Builds the watermark for a base image of the given size, without touching the base image.
+        Returns an (overlay, position, tiled) tuple, or None when there is nothing to draw.
+        A tiled overlay is a pattern cell that repeats over the whole image, starting at position.
+        The result only depends on the arguments, so it can be reused for every image of the same size.
+        """
+        if watermark_type == "image":
             if self.watermark_image is None:
                 raise ValueError("Watermark image not loaded. Please select one.")
+            return self._prepare_image_watermark(base_size, size_ratio, opacity_ratio)
+        return self._prepare_text_watermark(base_size, text_details, size_ratio, opacity_ratio)
 
-            img_width, img_height = base_image.size
-            wm_width, wm_height = self.watermark_image.size
-            target_wm_size = int(min(img_width, img_height) * size_ratio)
-            
-            if wm_width > wm_height:
-                new_wm_width = target_wm_size
-                new_wm_height = int(wm_height * (new_wm_width / wm_width))
+    def working_mode(self, original_mode, watermark):
+        """
+        Returns the mode to decode a base image into before apply_prepared.
+        RGB images stay RGB: a single overlay is pasted onto them (through its own alpha when it has
+        one) and a tiled one is blended into their RGB planes. Grayscale images stay grayscale for a
+        single overlay. Everything else is composited in RGBA.
+        """
+        overlay, position, tiled = watermark
+        if original_mode == "RGB":
+            return "RGB"
+        if original_mode == "L" and not tiled:
+            return "L"
+        return "RGBA"
+
+    def apply_prepared(self, base_image, watermark):
+        """
+        Composites a watermark returned by prepare_watermark onto a base image converted to
+        working_mode().
+        """
+        overlay, position, tiled = watermark
+        if tiled:
+            return self._composite_tiled(base_image, overlay, position)
+        if base_image.mode == "L":
+            # Only the overlay, which is small, is converted to gray; the base is saved as-is afterwards.
+            base_image.paste(overlay.convert("L"), position, overlay if overlay.mode == "RGBA" else None)
+        elif overlay.mode == "RGB":
+            base_image.paste(overlay, position)
+        elif base_image.mode == "RGB":
+            # An RGB base is opaque, so "over" reduces to a blend by the overlay's alpha, which paste does
+            # in place; the base never goes through RGBA and back.
+            base_image.paste(overlay, position, overlay)
+        else:
+            base_image.alpha_composite(overlay, position)
+        return base_image
+
+    def _composite_tiled(self, base_image, tile, origin, block_rows=64):
+        """
+        Alpha-composites a tile repeated over the whole base image in a single pass.
+        The pattern is looked up block by block from the tile, so no full-size watermark layer is
+        ever built and every output pixel is written once.
+        """
+        tile_arr = np.asarray(tile)
+        if njit is not None:
+            base = np.array(base_image)
+            _blend_tiled_kernel(base, tile_arr, origin[0], origin[1])
+            return Image.fromarray(base)
+
+        # The blend runs on separate R, G, B(, A) planes: every channel is a contiguous 2D array, so the
+        # arithmetic streams through memory instead of striding over interleaved pixels.
+        base_planes = [np.array(band) for band in base_image.split()]
+        has_alpha = len(base_planes) == 4
+        img_height, img_width = base_planes[0].shape
+        tile_height, tile_width = tile_arr.shape[:2]
+        # The tile is repeated across the image width once; each block then only picks whole rows of this strip.
+        cols = (np.arange(img_width) - origin[0]) % tile_width
+        strip_planes = [np.ascontiguousarray(tile_arr[:, cols, c]) for c in range(4)]
+
+        for top in range(0, img_height, block_rows):
+            block_slice = slice(top, top + block_rows)
+            rows = (np.arange(top, min(top + block_rows, img_height)) - origin[1]) % tile_height
+
+            wm_alpha = strip_planes[3][rows].astype(np.uint32)
+            if has_alpha:
+                base_weight = base_planes[3][block_slice].astype(np.uint32) * (255 - wm_alpha)
             else:
-                new_wm_height = target_wm_size
-                new_wm_width = int(wm_width * (new_wm_height / wm_height)) 
-            
-            new_wm_width = max(1, new_wm_width)
-            new_wm_height = max(1, new_wm_height)
-
-            resized_watermark = self.watermark_image.resize((new_wm_width, new_wm_height), Image.LANCZOS)
-
-            alpha = resized_watermark.split()[-1]
-            alpha = Image.eval(alpha, lambda x: x * opacity_ratio)
-            resized_watermark.putalpha(alpha)
-            padding = 20 
-            paste_x = img_width - new_wm_width - padding
-            paste_y = img_height - new_wm_height - padding
-
-            paste_x = max(0, paste_x)
-            paste_y = max(0, paste_y)
-
-            base_image.paste(resized_watermark, (paste_x, paste_y), resized_watermark)
-            base_image.save(output_path)
-        except Exception as e:
-            raise Exception(f"Failed to apply image watermark: {e}")
-
-
-
-
+                base_weight = 255 * (255 - wm_alpha) # An RGB base is fully opaque
+            out_alpha = wm_alpha * 255 + base_weight # Porter-Duff "over", scaled by 255
+            divisor = np.maximum(out_alpha, 1)
+            wm_weight = wm_alpha * 255
+            half = divisor // 2
+            # Like the kernel and Image.alpha_composite, pixels the tile does not cover keep their colour,
+            # even where the base is fully transparent and the blend would divide by zero.
+            covered = wm_alpha != 0
+            for base_plane, strip_plane in zip(base_planes[:3], strip_planes[:3]):
+                block = base_plane[block_slice]
+                np.copyto(block, (strip_plane[rows] * wm_weight + block * base_weight + half) // divisor,
+                          casting="unsafe", where=covered)
+            if has_alpha:
+                base_planes[3][block_slice] = (out_alpha + 127) // 255
+
+        return Image.merge(base_image.mode, [Image.fromarray(plane) for plane in base_planes])
+
+    def save_watermarked(self, watermarked_image, output_path, original_mode, high_quality=False):
+        """
+        Saves a watermarked result in a mode matching the input image's original mode, so formats without
+        an alpha channel (JPEG, BMP) can be written and grayscale inputs stay grayscale.
+        high_quality trades encode speed for quality (JPEG) or file size (PNG).
+        """
+        if original_mode in ("1", "L"):
+            output_mode = "L"
+        elif original_mode in ("RGBA", "LA", "PA", "P"):
+            output_mode = "RGBA"
+        else:
+            output_mode = "RGB"
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension in (".jpg", ".jpeg") and output_mode == "RGBA":
+            output_mode = "RGB"
+        if watermarked_image.mode != output_mode:
+            watermarked_image = watermarked_image.convert(output_mode)
+
+        # Explicit encoder settings: JPEG at a fixed quality with 4:2:0 chroma and no extra optimize pass,
+        # PNG at the fastest zlib level (PNG is lossless, so only the file size changes).
+        # High quality keeps full-resolution chroma, adds the Huffman optimize pass and uses zlib's default level.
+        # The file is encoded in memory and written with a single call; the encoders' many small writes
+        # are slow on network shares.
+        if extension in (".jpg", ".jpeg") and not high_quality and _turbo_jpeg is not None:
+            # Same settings through the TurboJPEG API, which skips Pillow's line-by-line encoder loop.
+            grayscale = output_mode == "L"
+            encoded = _turbo_jpeg.encode(np.asarray(watermarked_image), quality=90,
+                                         pixel_format=TJPF_GRAY if grayscale else TJPF_RGB,
+                                         jpeg_subsample=TJSAMP_GRAY if grayscale else TJSAMP_420)
+        else:
+            buffer = io.BytesIO()
+            if extension in (".jpg", ".jpeg"):
+                if high_quality:
+                    watermarked_image.save(buffer, "JPEG", quality=95, subsampling=0, optimize=True, progressive=False)
+                else:
+                    watermarked_image.save(buffer, "JPEG", quality=90, subsampling=2, optimize=False, progressive=False)
+            elif extension == ".png":
+                watermarked_image.save(buffer, "PNG", compress_level=6 if high_quality else 1)
+            else:
+                watermarked_image.save(buffer, Image.registered_extensions()[extension])
+            encoded = buffer.getbuffer()
+        with open(output_path, "wb") as f:
+            f.write(encoded)
@@ -3,18 +3,133 @@
 from PIL import Image, ImageDraw, ImageFont
 import os
 import glob # For listing files
-from PyQt5.QtCore import QObject, pyqtSignal # IMPORTANT: Ensure these are imported in logic.py
+import itertools
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PyQt5.QtCore import QObject, QElapsedTimer, pyqtSignal, pyqtSlot # IMPORTANT: Ensure these are imported in logic.py
 
-# Define WorkerSignals class (if not already defined in main.py and passed)
-# It's generally cleaner to define signals where they are emitted, or pass an emitter.
-# For this setup, passing the emitter is better.
-# If you define WorkerSignals in main.py, ensure it's imported here if you want to type-hint.
-# For now, we'll assume it's passed correctly.
+from .imagewatermarker import ImageWatermarker, warm_up_blend
+
+PREPARED_CACHE_SIZE = 8 # Distinct image sizes whose prepared watermark each pool process keeps
+PROGRESS_INTERVAL_MS = 100 # Minimum time between two progress messages
+# Freed image memory blocks (16 MB each) each pool process keeps for the next image. Reusing them
+# skips the page faults of freshly mapped memory, which cost about as much as the compositing itself.
+PILLOW_BLOCKS_MAX = 16
+
+
+class _FileWatermarker:
+    """
+    Watermarks single files inside a pool process.
+    Holds everything that stays the same for the whole job, including the prepared watermarks.
+    """
+    def __init__(self, watermark_type, watermark_size_ratio, watermark_opacity_ratio,
+                 watermark_image_path, text_details, high_quality_encode, max_input_dim):
+        self.watermark_type = watermark_type
+        self.watermark_size_ratio = watermark_size_ratio
+        self.watermark_opacity_ratio = watermark_opacity_ratio
+        self.text_details = text_details
+        self.high_quality_encode = high_quality_encode
+        self.max_input_dim = max_input_dim
+        self.watermarker = ImageWatermarker(watermark_image_path)
+        self._wm_cache = OrderedDict() # Prepared watermarks keyed by base image size, least recently used first
+
+        # Identifies the job's settings in the .wmstamp file written next to every output. Every pool
+        # process derives the same key from the same arguments.
+        watermark_mtime = os.stat(watermark_image_path).st_mtime_ns if watermark_image_path else None
+        job_settings = (watermark_type, watermark_size_ratio, watermark_opacity_ratio,
+                        watermark_image_path, watermark_mtime, text_details, high_quality_encode, max_input_dim)
+        self.stamp_key = hashlib.blake2b(repr(job_settings).encode(), digest_size=8).hexdigest()
+
+    def _get_prepared_watermark(self, base_size):
+        """
+        Returns the prepared watermark for a base image size, building it on first use.
+        Every setting except the base size is fixed for the whole job, so the size is the cache key.
+        Only the most recently used sizes are kept, so a folder of mixed sizes does not pile them up.
+        """
+        if base_size in self._wm_cache:
+            self._wm_cache.move_to_end(base_size)
+            return self._wm_cache[base_size]
+
+        watermark = self.watermarker.prepare_watermark(
+            base_size, self.watermark_type,
+            self.watermark_size_ratio, self.watermark_opacity_ratio,
+            self.text_details
+        )
+        self._wm_cache[base_size] = watermark
+        if len(self._wm_cache) > PREPARED_CACHE_SIZE:
+            self._wm_cache.popitem(last=False)
+        return watermark
+
+    def process(self, input_filepath, output_filepath):
+        """
+        Watermarks a single file, reusing the prepared watermark of earlier images of the same size.
+        Files already watermarked with the same settings by an earlier run are skipped.
+        """
+        input_stat = os.stat(input_filepath)
+        stamp = f"{self.stamp_key}:{input_stat.st_mtime_ns}:{input_stat.st_size}"
+        stamp_path = output_filepath + ".wmstamp"
+        if os.path.exists(output_filepath) and self._read_stamp(stamp_path) == stamp:
+            return
+
+        self.watermarker.apply(input_filepath, output_filepath, self.watermark_type,
+                               self.watermark_size_ratio, self.watermark_opacity_ratio, self.text_details,
+                               high_quality=self.high_quality_encode, max_input_dim=self.max_input_dim,
+                               get_watermark=self._get_prepared_watermark)
+        self._write_stamp(stamp_path, stamp)
+
+    def _read_stamp(self, stamp_path):
+        try:
+            with open(stamp_path, "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_stamp(self, stamp_path, stamp):
+        """
+        Records that the output is up to date. Written last and swapped in, so a stamp never
+        vouches for an output that was not completely saved.
+        """
+        temp_path = stamp_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(stamp)
+        os.replace(temp_path, stamp_path)
+
+
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+_file_watermarker = None # Set in every pool process by _init_process
+
+def _init_process(*file_watermarker_args):
+    """
+    Pool initializer. Only the watermark image's path is sent to the process, which is cheap to
+    pickle; each process decodes the image once here instead of once per file.
+    """
+    global _file_watermarker
+    if "PILLOW_BLOCKS_MAX" not in os.environ: # Pillow's own setting wins when the user has set it
+        Image.core.set_blocks_max(PILLOW_BLOCKS_MAX)
+    _file_watermarker = _FileWatermarker(*file_watermarker_args)
+    # Only the repeated text pattern goes through the tiled blend kernel.
+    text_details = _file_watermarker.text_details
+    if _file_watermarker.watermark_type == "text" and text_details and text_details.get('repetition_enabled'):
+        warm_up_blend()
+
+def _process_file(input_filepath, output_filepath):
+    _file_watermarker.process(input_filepath, output_filepath)
+
+
+class WatermarkWorker(QObject):
+    """
+    Runs a watermarking job. The GUI moves it to a QThread and starts run() from the thread's started signal.
+    """
+    update_progress = pyqtSignal(str)
+    progress_percent = pyqtSignal(int) # Emitted only when the whole percentage changes
+    job_finished = pyqtSignal(int, int, list) # processed count, total count, error messages
 
-class WatermarkWorker:
     def __init__(self, input_folder, output_folder, watermark_type,
                  watermark_size_ratio, watermark_opacity_ratio,
-                 watermarker_instance, text_details=None):
+                 watermarker_instance, text_details=None, high_quality_encode=False, max_input_dim=None):
+        super().__init__()
         self.input_folder = input_folder
         self.output_folder = output_folder
         self.watermark_type = watermark_type
@@ -22,84 +137,137 @@ class WatermarkWorker:
         self.watermark_opacity_ratio = watermark_opacity_ratio
         self.watermarker = watermarker_instance
         self.text_details = text_details
-        self._signal_emitter = None # This will be set by set_signal_emitter
+        self.high_quality_encode = high_quality_encode
+        self.max_input_dim = max_input_dim # JPEGs larger than this are decoded at a reduced scale
+        self._stop_requested = False
 
-    def set_signal_emitter(self, emitter):
+    def stop(self):
         """
-        Sets the QObject instance that will emit signals to the GUI thread.
+        Asks a running job to stop. Called from the GUI thread; files already handed to the pool still finish.
         """
-        self._signal_emitter = emitter
+        self._stop_requested = True
 
+    def _iter_image_files(self):
+        """
+        Yields the names of the supported image files in the input folder while the directory is
+        being read. os.scandir reports the entry type without an extra stat call per file.
+        """
+        with os.scandir(self.input_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield entry.name
+
+    @pyqtSlot()
     def run(self):
         """
         The main watermarking logic to be run in a separate thread.
         """
-        image_files = [] # Initialize as empty list
+        total_images = 0
         errors = []
 
         try:
             # Check if input folder exists and is a directory
             if not os.path.isdir(self.input_folder):
                 errors.append(f"Input folder not found or is not a directory: '{self.input_folder}'")
-                if self._signal_emitter:
-                    self._signal_emitter.job_finished.emit(0, 0, errors)
+                self.job_finished.emit(0, 0, errors)
                 return
 
-            # List files in the input_folder
-            all_files_in_folder = os.listdir(self.input_folder)
-            image_files = [f for f in all_files_in_folder
-                           if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
-            
+            # Count the images up front for the progress messages; the files themselves are
+            # streamed into the pool by a second scan further down.
+            total_images = sum(1 for _ in self._iter_image_files())
+
         except FileNotFoundError:
             errors.append(f"Input folder does not exist: '{self.input_folder}'")
-            if self._signal_emitter:
-                self._signal_emitter.job_finished.emit(0, 0, errors)
+            self.job_finished.emit(0, 0, errors)
             return
         except PermissionError:
             errors.append(f"Permission denied to access input folder: '{self.input_folder}'")
-            if self._signal_emitter:
-                self._signal_emitter.job_finished.emit(0, 0, errors)
+            self.job_finished.emit(0, 0, errors)
             return
         except Exception as e:
             errors.append(f"Unexpected error listing files in input folder: {e}")
-            if self._signal_emitter:
-                self._signal_emitter.job_finished.emit(0, 0, errors)
+            self.job_finished.emit(0, 0, errors)
             return
 
-        total_images = len(image_files)
         processed_count = 0
 
         if total_images == 0: # Handle case where no images are found after filtering
-            if self._signal_emitter:
-                self._signal_emitter.job_finished.emit(0, 0, ["No supported image files found in the input folder."])
+            self.job_finished.emit(0, 0, ["No supported image files found in the input folder."])
             return
 
-        for i, filename in enumerate(image_files):
-            input_filepath = os.path.join(self.input_folder, filename)
-            output_filepath = os.path.join(self.output_folder, filename)
+        initargs = (
+            self.watermark_type, self.watermark_size_ratio, self.watermark_opacity_ratio,
+            self.watermarker.watermark_image_path if self.watermark_type == "image" else None,
+            self.text_details, self.high_quality_encode, self.max_input_dim
+        )
+        max_workers = min(os.cpu_count() or 1, total_images)
+
+        # Files are fed to the pool through a bounded window: every process always has its next
+        # file queued, so its decode/encode overlaps with the other processes' compositing,
+        # without queueing the whole folder up front.
+        max_in_flight = 2 * max_workers
+        remaining_files = self._iter_image_files()
+        pending = {}
+        completed_count = 0
+        # Progress messages are sent at most every PROGRESS_INTERVAL_MS and the percentage only when
+        # it changes, so a large folder does not flood the GUI thread with status bar repaints.
+        progress_timer = QElapsedTimer()
+        progress_timer.start()
+        last_percent = 0
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_process, initargs=initargs) as executor:
+                while True:
+                    if self._stop_requested:
+                        remaining_files = iter(())
+                    try:
+                        for filename in itertools.islice(remaining_files, max_in_flight - len(pending)):
+                            input_filepath = os.path.join(self.input_folder, filename)
+                            output_filepath = os.path.join(self.output_folder, filename)
+                            pending[executor.submit(_process_file, input_filepath, output_filepath)] = filename
+                    except OSError as e:
+                        errors.append(f"Error reading input folder: {e}")
+                        remaining_files = iter(())
+                    except RuntimeError:
+                        remaining_files = itertools.chain([filename], remaining_files) # Not submitted after all
+                        raise
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        filename = pending.pop(future)
+                        completed_count += 1
+                        try:
+                            future.result()
+                            processed_count += 1
+                        except Exception as e:
+                            # Listed in full when the job finishes; the progress message only counts them.
+                            errors.append(f"Error processing {filename}: {e}")
+
+                        if progress_timer.elapsed() >= PROGRESS_INTERVAL_MS or completed_count == total_images:
+                            progress_timer.restart()
+                            message = f"Processing {completed_count}/{total_images}: {filename}"
+                            if errors:
+                                message += f" ({len(errors)} failed)"
+                            self.update_progress.emit(message)
+
+                        percent = completed_count * 100 // total_images
+                        if percent != last_percent:
+                            last_percent = percent
+                            self.progress_percent.emit(percent)
 
+        except (RuntimeError, ValueError) as e:
+            # The pool broke (a process failed to start or died, e.g. out of memory; BrokenProcessPool is a
+            # RuntimeError) or could not be created (ValueError for too many workers on Windows).
+            errors.append(f"Watermarking stopped: {e}")
+            unprocessed = list(pending.values())
             try:
-                if self.watermark_type == "image":
-                    self.watermarker.apply_watermark_image(
-                        input_filepath, output_filepath,
-                        self.watermark_size_ratio, self.watermark_opacity_ratio
-                    )
-                elif self.watermark_type == "text":
-                    self.watermarker.apply_watermark_text(
-                        input_filepath, output_filepath,
-                        self.text_details, # Pass the dictionary
-                        self.watermark_size_ratio,
-                        self.watermark_opacity_ratio
-                    )
-                processed_count += 1
-                if self._signal_emitter:
-                    self._signal_emitter.update_progress.emit(f"Processing {i+1}/{total_images}: {filename}")
-            except Exception as e:
-                errors.append(f"Error processing {filename}: {e}")
-                if self._signal_emitter:
-                    self._signal_emitter.update_progress.emit(f"Error on {filename}. Processed {i+1}/{total_images}.")
-
-        if self._signal_emitter:
-            self._signal_emitter.job_finished.emit(processed_count, total_images, errors)
+                unprocessed.extend(remaining_files)
+            except OSError:
+                pass
+            errors.extend(f"Not processed: {filename}" for filename in unprocessed)
+        finally:
+            self.job_finished.emit(processed_count, total_images, errors)
 
 
@@ -0,0 +1,219 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, JpegImagePlugin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic import ImageWatermarker
+from logic import imagewatermarker
+from logic.watermarkworker import _FileWatermarker
+
+
+def test_constructor_loads_watermark(tmp_path):
+    path = str(tmp_path / "watermark.png")
+    Image.new("RGBA", (40, 20), (255, 0, 0, 128)).save(path)
+
+    watermarker = ImageWatermarker(path)
+
+    assert watermarker.watermark_image is not None
+    assert watermarker.watermark_image.mode == "RGBA"
+    assert watermarker.watermark_image.size == (40, 20)
+    assert watermarker.watermark_image_path == path
+
+
+def test_constructor_rejects_missing_file(tmp_path):
+    with pytest.raises(IOError):
+        ImageWatermarker(str(tmp_path / "missing.png"))
+
+
+@pytest.mark.skipif(imagewatermarker._turbo_jpeg is None, reason="PyTurboJPEG is not installed")
+@pytest.mark.parametrize("mode, left, right", [("RGB", (220, 30, 30), (30, 30, 220)), ("L", (40,), (210,))])
+def test_turbojpeg_encode(tmp_path, monkeypatch, mode, left, right):
+    calls = []
+    encode = imagewatermarker._turbo_jpeg.encode
+
+    def counting_encode(*args, **kwargs):
+        calls.append(kwargs)
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(imagewatermarker._turbo_jpeg, "encode", counting_encode)
+    image = Image.new(mode, (64, 48), left)
+    image.paste(Image.new(mode, (32, 48), right), (32, 0))
+    path = str(tmp_path / "out.jpg")
+
+    ImageWatermarker().save_watermarked(image, path, mode)
+
+    assert calls # Written by TurboJPEG, not Pillow
+    with Image.open(path) as saved:
+        assert saved.format == "JPEG"
+        assert saved.mode == mode
+        assert saved.size == (64, 48)
+        if mode == "RGB":
+            assert JpegImagePlugin.get_sampling(saved) == 2 # 4:2:0
+        # Channel order and levels survive: both halves decode close to their colour.
+        for position, expected in (((8, 24), left), ((56, 24), right)):
+            pixel = saved.getpixel(position)
+            pixel = pixel if mode == "RGB" else (pixel,)
+            assert all(abs(got - want) <= 8 for got, want in zip(pixel, expected))
+
+
+def _tiled_images(seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, (50, 70, 4), np.uint8)
+    base[:, :20, 3] = 0 # Fully transparent areas, with colour left in them
+    base[30:, :, 3] = 255
+    tile = rng.integers(0, 256, (13, 17, 4), np.uint8)
+    tile[:, :6, 3] = 0 # Parts of the pattern that leave the base as it is
+    return Image.fromarray(base), Image.fromarray(tile)
+
+
+def _tiled_reference(base, tile, origin):
+    tile_arr = np.asarray(tile)
+    rows = (np.arange(base.height) - origin[1]) % tile.height
+    cols = (np.arange(base.width) - origin[0]) % tile.width
+    return Image.alpha_composite(base, Image.fromarray(tile_arr[rows][:, cols]))
+
+
+@pytest.mark.parametrize("use_numba", [False, True])
+def test_composite_tiled_matches_alpha_composite(monkeypatch, use_numba):
+    if use_numba and imagewatermarker.njit is None:
+        pytest.skip("numba is not installed")
+    if not use_numba:
+        monkeypatch.setattr(imagewatermarker, "njit", None)
+    base, tile = _tiled_images()
+    origin = (-5, 3)
+
+    result = ImageWatermarker()._composite_tiled(base.copy(), tile, origin)
+
+    expected = np.asarray(_tiled_reference(base, tile, origin)).astype(int)
+    # Pillow blends in fixed point, so a channel may round one step the other way.
+    assert np.abs(np.asarray(result).astype(int) - expected).max() <= 1
+
+
+TEXT_DETAILS = {
+    'sender_text': 'Sender', 'receiver_text': 'Receiver', 'font_family': 'Arial', 'font_size_pt': 24,
+    'color_rgb': (200, 40, 30), 'outline_enabled': False, 'repetition_enabled': False,
+}
+
+
+def _save_input(path, mode="RGB", size=(160, 120), seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 4), np.uint8)
+    Image.fromarray(pixels).convert(mode).save(path)
+
+
+def _pixels(path):
+    with Image.open(path) as image:
+        return image.mode, np.asarray(image)
+
+
+@pytest.mark.parametrize("watermark_type, text_details", [
+    ("image", None),
+    ("text", TEXT_DETAILS),
+    ("text", dict(TEXT_DETAILS, repetition_enabled=True, outline_enabled=True)),
+])
+def test_prepared_watermark_reuse_gives_same_output(tmp_path, watermark_type, text_details):
+    watermark_path = None
+    if watermark_type == "image":
+        watermark_path = str(tmp_path / "watermark.png")
+        Image.new("RGBA", (40, 20), (255, 0, 0, 128)).save(watermark_path)
+    file_watermarker = _FileWatermarker(watermark_type, 0.3, 0.6, watermark_path, text_details, False, None)
+    watermarker = ImageWatermarker(watermark_path)
+
+    for index, mode in enumerate(("RGB", "RGBA", "L")):
+        input_path = str(tmp_path / f"in{index}.png")
+        _save_input(input_path, mode, seed=index)
+        file_watermarker.process(input_path, str(tmp_path / f"reused{index}.png"))
+        watermarker.apply(input_path, str(tmp_path / f"fresh{index}.png"), watermark_type, 0.3, 0.6, text_details)
+
+        reused_mode, reused = _pixels(tmp_path / f"reused{index}.png")
+        fresh_mode, fresh = _pixels(tmp_path / f"fresh{index}.png")
+        assert reused_mode == fresh_mode == mode
+        assert np.array_equal(reused, fresh)
+    assert len(file_watermarker._wm_cache) == 1 # All three inputs share one prepared watermark
+
+
+def test_stamp_skips_up_to_date_output_and_rewrites_stale_one(tmp_path):
+    input_path = str(tmp_path / "in.png")
+    output_path = str(tmp_path / "out.png")
+    _save_input(input_path)
+    file_watermarker = _FileWatermarker("text", 0.3, 0.6, None, TEXT_DETAILS, False, None)
+
+    file_watermarker.process(input_path, output_path)
+    assert os.path.exists(output_path + ".wmstamp")
+
+    # Same input and settings: the output is left alone.
+    with open(output_path, "wb") as f:
+        f.write(b"kept")
+    file_watermarker.process(input_path, output_path)
+    with open(output_path, "rb") as f:
+        assert f.read() == b"kept"
+
+    # A changed input is watermarked again.
+    input_stat = os.stat(input_path)
+    os.utime(input_path, ns=(input_stat.st_atime_ns, input_stat.st_mtime_ns + 10**9))
+    file_watermarker.process(input_path, output_path)
+    assert _pixels(output_path)[0] == "RGB"
+
+    # So is an unchanged input under different settings.
+    with open(output_path, "wb") as f:
+        f.write(b"stale")
+    _FileWatermarker("text", 0.3, 0.7, None, TEXT_DETAILS, False, None).process(input_path, output_path)
+    assert _pixels(output_path)[0] == "RGB"
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "MPO"])
+def test_large_jpeg_is_decoded_at_reduced_scale(tmp_path, image_format):
+    input_path = str(tmp_path / "in.jpg")
+    image = Image.new("RGB", (400, 300), (90, 120, 150))
+    if image_format == "MPO": # Like phone photos, which carry a second picture
+        image.save(input_path, "MPO", save_all=True, append_images=[image])
+    else:
+        image.save(input_path, "JPEG")
+    with Image.open(input_path) as saved:
+        assert saved.format == image_format
+    output_path = str(tmp_path / "out.png")
+
+    ImageWatermarker().apply(input_path, output_path, "text", 0.3, 0.6, TEXT_DETAILS, max_input_dim=100)
+
+    with Image.open(output_path) as output:
+        assert output.size == (100, 75) # libjpeg's 1/4 scale, the smallest not below 100 pixels
+
+
+def test_legacy_config_is_migrated_to_settings_ini(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    monkeypatch.chdir(tmp_path)
+    # The key=value file earlier versions wrote into the working folder.
+    (tmp_path / "watermarker_config.txt").write_text(
+        "sender_text=Alice\nreceiver_text=Bob\nwatermark_opacity=77\ntext_color=#ff0000\n"
+        "text_outline_enabled=True\ntext_repetition_enabled=False\nselected_watermark_type=text\n")
+    from PyQt5.QtCore import QSettings
+    from PyQt5.QtWidgets import QApplication
+    import image_watermarker
+
+    app = QApplication.instance() or QApplication([]) # Kept referenced until the windows are gone
+    window = image_watermarker.WatermarkApp()
+    assert window.sender_text == "Alice"
+    assert window.receiver_text == "Bob"
+    assert window.watermark_opacity_value == 77
+    assert window.text_color.name() == "#ff0000"
+    assert window.text_outline_enabled is True
+    assert window.text_repetition_enabled is False
+    window.close()
+
+    settings_path = tmp_path / "home" / ".config" / "image_watermarker" / "settings.ini"
+    store = QSettings(str(settings_path), QSettings.IniFormat)
+    assert store.value("sender_text") == "Alice"
+    assert store.value("watermark_opacity", type=int) == 77
+    assert store.value("text_outline_enabled", type=bool) is True
+
+    # From now on settings.ini is read; the old file is not needed any more.
+    os.remove(tmp_path / "watermarker_config.txt")
+    window = image_watermarker.WatermarkApp()
+    assert window.sender_text == "Alice"
+    assert window.watermark_opacity_value == 77
+    window.close()
+    app.processEvents()